@@ -1,18 +1,20 @@
-from bisect import bisect_left
-from collections import defaultdict
+from collections import Counter, defaultdict
 import contextlib
 import itertools
 import re
 import json
+import string
 
 from odoo import api, fields, models, _, Command
 from odoo.osv import expression
 from odoo.exceptions import UserError, ValidationError, RedirectWarning
-from odoo.tools import SQL, Query
+from odoo.tools import SQL, Query, escape_psql, ormcache
+from odoo.tools.sql import create_index
 
 
 ACCOUNT_REGEX = re.compile(r'(?:(\S*\d+\S*))?(.*)')
-ACCOUNT_CODE_REGEX = re.compile(r'^[A-Za-z0-9.]+$')
+# Deletes every character allowed in an account code: whatever remains is invalid.
+ACCOUNT_CODE_INVALID_CHARS_TRANS = str.maketrans('', '', string.ascii_letters + string.digits + '.')
 ACCOUNT_CODE_NUMBER_REGEX = re.compile(r'(.*?)(\d*)(\D*?)$')
 
 
@@ -32,6 +34,9 @@ class AccountAccount(models.Model):
 
     @api.constrains('account_type')
     def _check_account_type_unique_current_year_earning(self):
+        # Only an account becoming "Current Year Earnings" can introduce a duplicate.
+        if not any(account.account_type == 'equity_unaffected' for account in self):
+            return
         result = self._read_group(
             domain=[('account_type', '=', 'equity_unaffected')],
             groupby=['company_ids'],
@@ -74,12 +79,12 @@ class AccountAccount(models.Model):
         ],
         string="Type", tracking=True,
         required=True,
-        compute='_compute_account_type', store=True, readonly=False, precompute=True, index=True,
+        compute='_compute_account_type_and_tags', store=True, readonly=False, precompute=True, index=True,
         help="Account Type is used for information purpose, to generate country-specific legal reports, and set the rules to close a fiscal year and generate opening entries."
     )
     include_initial_balance = fields.Boolean(string="Bring Accounts Balance Forward",
         help="Used in reports to know if we should consider journal items from the beginning of time instead of from the fiscal year only. Account types that should be reset to zero at each new fiscal year (like expenses, revenue..) should not have this option set.",
-        compute="_compute_include_initial_balance",
+        compute="_compute_internal_group_and_include_initial_balance",
         search="_search_include_initial_balance",
     )
     internal_group = fields.Selection(
@@ -92,7 +97,7 @@ class AccountAccount(models.Model):
             ('off', 'Off Balance'),
         ],
         string="Internal Group",
-        compute="_compute_internal_group",
+        compute="_compute_internal_group_and_include_initial_balance",
         search='_search_internal_group',
     )
     reconcile = fields.Boolean(string='Allow Reconciliation', tracking=True,
@@ -112,7 +117,7 @@ class AccountAccount(models.Model):
     tag_ids = fields.Many2many(
         comodel_name='account.account.tag',
         relation='account_account_account_tag',
-        compute='_compute_account_tags', readonly=False, store=True, precompute=True,
+        compute='_compute_account_type_and_tags', readonly=False, store=True, precompute=True,
         string='Tags',
         help="Optional tags you may want to assign for custom reporting",
         ondelete='restrict',
@@ -196,15 +201,20 @@ class AccountAccount(models.Model):
     def _constrains_allowed_journal_ids(self):
         self.env['account.move.line'].flush_model(['account_id', 'journal_id'])
         self.flush_recordset(['allowed_journal_ids'])
+        # Accounts without any allowed journal are left out by the inner join on the relation.
         self._cr.execute("""
             SELECT aml.id
             FROM account_move_line aml
+            JOIN account_account_account_journal_rel restricted
+              ON restricted.account_account_id = aml.account_id
+            LEFT JOIN account_account_account_journal_rel allowed
+              ON allowed.account_account_id = aml.account_id
+             AND allowed.account_journal_id = aml.journal_id
             WHERE aml.account_id in %s
-            AND EXISTS (SELECT 1 FROM account_account_account_journal_rel WHERE account_account_id = aml.account_id)
-            AND NOT EXISTS (SELECT 1 FROM account_account_account_journal_rel WHERE account_account_id = aml.account_id AND account_journal_id = aml.journal_id)
+            AND allowed.account_journal_id IS NULL
+            LIMIT 1
         """, [tuple(self.ids)])
-        ids = self._cr.fetchall()
-        if ids:
+        if self._cr.fetchone():
             raise ValidationError(_('Some journal items already exist with this account but in other journals than the allowed ones.'))
 
     @api.constrains('currency_id')
@@ -221,52 +231,29 @@ class AccountAccount(models.Model):
             'default_account_id',
             'suspense_account_id',
         ])
-        self.env['account.payment.method'].flush_model(['payment_type'])
-        self.env['account.payment.method.line'].flush_model(['payment_method_id', 'payment_account_id'])
+        self.env['account.payment.method.line'].flush_model(['journal_id', 'payment_account_id'])
 
+        # Every payment method is either inbound or outbound: their payment accounts are checked together.
         self._cr.execute('''
             SELECT
                 account.id,
                 journal.id
             FROM account_journal journal
             JOIN res_company company ON company.id = journal.company_id
-            JOIN account_account account ON account.id = journal.default_account_id
-            WHERE journal.currency_id IS NOT NULL
-            AND journal.currency_id != company.currency_id
-            AND account.currency_id != journal.currency_id
-            AND account.id IN %(accounts)s
-
-            UNION ALL
-
-            SELECT
-                account.id,
-                journal.id
-            FROM account_journal journal
-            JOIN res_company company ON company.id = journal.company_id
-            JOIN account_payment_method_line apml ON apml.journal_id = journal.id
-            JOIN account_payment_method apm on apm.id = apml.payment_method_id
-            JOIN account_account account ON account.id = apml.payment_account_id
-            WHERE journal.currency_id IS NOT NULL
-            AND journal.currency_id != company.currency_id
-            AND account.currency_id != journal.currency_id
-            AND apm.payment_type = 'inbound'
-            AND account.id IN %(accounts)s
-
-            UNION ALL
-
-            SELECT
-                account.id,
-                journal.id
-            FROM account_journal journal
-            JOIN res_company company ON company.id = journal.company_id
-            JOIN account_payment_method_line apml ON apml.journal_id = journal.id
-            JOIN account_payment_method apm on apm.id = apml.payment_method_id
-            JOIN account_account account ON account.id = apml.payment_account_id
+            JOIN account_account account ON account.currency_id != journal.currency_id
             WHERE journal.currency_id IS NOT NULL
             AND journal.currency_id != company.currency_id
-            AND account.currency_id != journal.currency_id
-            AND apm.payment_type = 'outbound'
             AND account.id IN %(accounts)s
+            AND (
+                account.id = journal.default_account_id
+                OR EXISTS (
+                    SELECT 1
+                    FROM account_payment_method_line apml
+                    WHERE apml.journal_id = journal.id
+                    AND apml.payment_account_id = account.id
+                )
+            )
+            LIMIT 1
         ''', {
             'accounts': tuple(self.ids)
         })
@@ -290,32 +277,35 @@ class AccountAccount(models.Model):
         if self.filtered(lambda a: a.account_type == 'asset_cash' and len(a.company_ids) > 1):
             raise ValidationError(_("Bank & Cash accounts cannot be shared between companies."))
 
-        for companies, accounts in self.grouped(lambda a: a.company_ids).items():
-            if self.env['account.move.line'].sudo().search_count([
-                ('account_id', 'in', accounts.ids),
-                '!', ('company_id', 'child_of', companies.ids)
-            ], limit=1):
-                raise UserError(_("You can't unlink this company from this account since there are some journal items linked to it."))
-
-    @api.constrains('account_type')
-    def _check_account_type_sales_purchase_journal(self):
-        if not self:
+        if not self.ids:
             return
-
-        self.env['account.account'].flush_model(['account_type'])
-        self.env['account.journal'].flush_model(['type', 'default_account_id'])
-        self._cr.execute('''
-            SELECT account.id
-            FROM account_account account
-            JOIN account_journal journal ON journal.default_account_id = account.id
-            WHERE account.id IN %s
-            AND account.account_type IN ('asset_receivable', 'liability_payable')
-            AND journal.type IN ('sale', 'purchase')
-            LIMIT 1;
-        ''', [tuple(self.ids)])
-
-        if self._cr.fetchone():
-            raise ValidationError(_("The account is already in use in a 'sale' or 'purchase' journal. This means that the account's type couldn't be 'receivable' or 'payable'."))
+        # Expand the companies of each account to all their branches, so that journal items only need an equality check.
+        accounts = self.sudo()
+        branches = self.env['res.company'].sudo().with_context(active_test=False).search([('id', 'child_of', accounts.company_ids.ids)])
+        allowed_companies = [
+            SQL("(%s, %s)", account.id, branch.id)
+            for account in accounts
+            for branch in branches
+            if account.company_ids & branch.parent_ids
+        ]
+        self.env['account.move.line'].flush_model(['account_id', 'company_id'])
+        if self.env.execute_query(SQL(
+            """
+                SELECT 1
+                  FROM account_move_line aml
+                 WHERE aml.account_id IN %(account_ids)s
+                   AND NOT EXISTS (
+                        SELECT 1
+                          FROM (VALUES %(allowed_companies)s) AS allowed(account_id, company_id)
+                         WHERE allowed.account_id = aml.account_id
+                           AND allowed.company_id = aml.company_id
+                   )
+                 LIMIT 1
+            """,
+            account_ids=tuple(self.ids),
+            allowed_companies=SQL(", ").join(allowed_companies),
+        )):
+            raise UserError(_("You can't unlink this company from this account since there are some journal items linked to it."))
 
     @api.constrains('reconcile')
     def _check_used_as_journal_default_debit_credit_account(self):
@@ -350,33 +340,43 @@ class AccountAccount(models.Model):
 
     @api.constrains('code')
     def _check_account_code(self):
-        for account in self:
-            if account.code and not re.match(ACCOUNT_CODE_REGEX, account.code):
+        for code in self.filtered('code').mapped('code'):
+            if code.translate(ACCOUNT_CODE_INVALID_CHARS_TRANS):
                 raise ValidationError(_(
                     "The account code can only contain alphanumeric characters and dots."
                 ))
 
     @api.constrains('account_type')
     def _check_account_is_bank_journal_bank_account(self):
+        if not self:
+            return
+
         self.env['account.account'].flush_model(['account_type'])
         self.env['account.journal'].flush_model(['type', 'default_account_id'])
+        # Report sale/purchase journals first, as they have a dedicated error message.
         self._cr.execute('''
-            SELECT journal.id
+            SELECT journal.type IN ('sale', 'purchase')
               FROM account_journal journal
               JOIN account_account account ON journal.default_account_id = account.id
              WHERE account.account_type IN ('asset_receivable', 'liability_payable')
                AND account.id IN %s
+          ORDER BY 1 DESC
              LIMIT 1;
         ''', [tuple(self.ids)])
 
-        if self._cr.fetchone():
+        res = self._cr.fetchone()
+        if res and res[0]:
+            raise ValidationError(_("The account is already in use in a 'sale' or 'purchase' journal. This means that the account's type couldn't be 'receivable' or 'payable'."))
+        if res:
             raise ValidationError(_("You cannot change the type of an account set as Bank Account on a journal to Receivable or Payable."))
 
     @api.depends_context('company')
     def _compute_code(self):
-        for record, record_root in zip(self, self.with_company(self.env.company.root_id).sudo()):
-            # Need to set record.code with `company = self.env.company`, not `self.env.company.root_id`
-            record.code = record_root.code_store
+        # Need to set record.code with `company = self.env.company`, not `self.env.company.root_id`.
+        # The values are put in cache directly, as assigning them one by one is costly on large recordsets.
+        codes = self.with_company(self.env.company.root_id).sudo().mapped('code_store')
+        field = self._fields['code']
+        self.env.cache.update(self, field, [field.convert_to_cache(code, self) for code in codes])
 
     def _search_code(self, operator, value):
         return [('id', 'in', self.with_company(self.env.company.root_id).sudo()._search([('code_store', operator, value)]))]
@@ -409,8 +409,8 @@ class AccountAccount(models.Model):
     @api.depends_context('company')
     @api.depends('code')
     def _compute_account_root(self):
-        for record in self:
-            record.root_id = self.env['account.root']._from_account_code(record.placeholder_code)
+        for placeholder_code, records in self.grouped('placeholder_code').items():
+            records.root_id = self.env['account.root']._from_account_code(placeholder_code)
 
     def _search_account_root(self, operator, value):
         if operator in ['=', 'child_of']:
@@ -429,10 +429,8 @@ class AccountAccount(models.Model):
         placeholder_code_alias = self.env['account.account']._field_to_sql('account_account', 'code', query_account)
 
         placeholder_codes = self.env.execute_query(query_account.select(placeholder_code_alias))
-        return {
-            (root := self.env['account.root']._from_account_code(code)).id: {'id': root.id, 'display_name': root.display_name}
-            for code, in placeholder_codes if code
-        }
+        roots = self.env['account.root']._from_account_codes(code for code, in placeholder_codes)
+        return {root.id: {'id': root.id, 'display_name': root.display_name} for root in roots}
 
     @api.depends_context('company')
     @api.depends('code')
@@ -454,7 +452,7 @@ class AccountAccount(models.Model):
                    FROM (VALUES %(account_code_values)s) AS account_code (code)
               LEFT JOIN account_group agroup
                      ON agroup.code_prefix_start <= LEFT(account_code.code, char_length(agroup.code_prefix_start))
-                        AND agroup.code_prefix_end >= LEFT(account_code.code, char_length(agroup.code_prefix_end))
+                        AND agroup.code_prefix_end >= LEFT(account_code.code, char_length(agroup.code_prefix_start))
                         AND agroup.company_id = %(root_company_id)s
                ORDER BY account_code.code, char_length(agroup.code_prefix_start) DESC, agroup.id
             """,
@@ -463,27 +461,39 @@ class AccountAccount(models.Model):
         ))
         group_by_code = dict(results)
 
-        for account in accounts_with_code:
-            account.group_id = group_by_code[account.code]
+        for group_id, accounts in accounts_with_code.grouped(lambda account: group_by_code[account.code]).items():
+            accounts.group_id = self.env['account.group'].browse(group_id)
 
     def _search_used(self, operator, value):
         if operator not in ['=', '!='] or not isinstance(value, bool):
             raise UserError(_('Operation not supported'))
         if operator != '=':
             value = not value
-        self._cr.execute("""
-            SELECT id FROM account_account account
-            WHERE EXISTS (SELECT 1 FROM account_move_line aml WHERE aml.account_id = account.id LIMIT 1)
-        """)
-        return [('id', 'in' if value else 'not in', [r[0] for r in self._cr.fetchall()])]
+        query = Query(self.env, 'account_account')
+        query.add_where(SQL(
+            "EXISTS (SELECT 1 FROM account_move_line aml WHERE aml.account_id = account_account.id)",
+            to_flush=self.env['account.move.line']._fields['account_id'],
+        ))
+        return [('id', 'in' if value else 'not in', query)]
 
     def _compute_used(self):
-        ids = set(self._search_used('=', True)[0][2])
+        used_ids = set()
+        if self.ids:
+            used_ids = {account_id for account_id, in self.env.execute_query(SQL(
+                """
+                    SELECT account.id
+                      FROM account_account account
+                     WHERE account.id IN %(account_ids)s
+                       AND EXISTS (SELECT 1 FROM account_move_line aml WHERE aml.account_id = account.id)
+                """,
+                account_ids=tuple(self.ids),
+                to_flush=self.env['account.move.line']._fields['account_id'],
+            ))}
         for record in self:
-            record.used = record.id in ids
+            record.used = record.id in used_ids
 
     @api.model
-    def _search_new_account_code(self, start_code, cache=None):
+    def _search_new_account_code(self, start_code, cache=None, used_codes=None):
         """ Get an available account code by starting from an existing code
             and incrementing it until an available code is found.
 
@@ -506,6 +516,9 @@ class AccountAccount(models.Model):
                                     *strictly* greater than start_code.
                                     If you want the method to start at start_code, you should
                                     explicitly pass cache={}.
+            :param set[str] used_codes: the existing codes that could be checked, as returned by
+                                        `_get_used_account_codes` (optional, to fetch them at once
+                                        for several start codes). If none is given, they are fetched.
 
             :return str: an available new account code for `company`.
                          It will normally have length `len(start_code)`.
@@ -516,14 +529,17 @@ class AccountAccount(models.Model):
         if cache is None:
             cache = {start_code}
 
+        if used_codes is None:
+            used_codes = self._get_used_account_codes([start_code])
+
+        start_str, digits_str, end_str = ACCOUNT_CODE_NUMBER_REGEX.match(start_code).groups()
+
         def code_is_available(new_code):
-            return new_code not in cache and not self.search_count([('code', '=', new_code)], limit=1)
+            return new_code not in cache and new_code not in used_codes
 
         if code_is_available(start_code):
             return start_code
 
-        start_str, digits_str, end_str = ACCOUNT_CODE_NUMBER_REGEX.match(start_code).groups()
-
         if digits_str != '':
             d, n = len(digits_str), int(digits_str)
             for num in range(n+1, 10**d):
@@ -536,73 +552,145 @@ class AccountAccount(models.Model):
 
         raise UserError(_('Cannot generate an unused account code.'))
 
+    @api.model
+    def _get_used_account_codes(self, start_codes):
+        """ Fetch at once every existing code that `_search_new_account_code` could check
+            when starting from any of `start_codes`, rather than checking them one by one.
+
+            :param start_codes: an iterable of codes to start from
+            :return set[str]: the codes in use among the candidates
+        """
+        candidates_domains = []
+        for start_code in start_codes:
+            start_str, digits_str, end_str = ACCOUNT_CODE_NUMBER_REGEX.match(start_code).groups()
+            candidates_domains += [
+                [('code', '=', start_code)],
+                [('code', '=like', f'{escape_psql(start_code)}.copy%')],
+            ]
+            if digits_str != '':
+                candidates_domains.append([('code', '=like', f"{escape_psql(start_str)}{'_' * len(digits_str)}{escape_psql(end_str)}")])
+        if not candidates_domains:
+            return set()
+        return set(self.search_fetch(expression.OR(candidates_domains), ['code']).mapped('code'))
+
     @api.depends_context('company')
     def _compute_current_balance(self):
-        balances = {
-            account.id: balance
-            for account, balance in self.env['account.move.line']._read_group(
-                domain=[('account_id', 'in', self.ids), ('parent_state', '=', 'posted'), ('company_id', '=', self.env.company.id)],
-                groupby=['account_id'],
-                aggregates=['balance:sum'],
-            )
-        }
+        if not self.ids:
+            self.current_balance = 0
+            return
+        # No explicit `order`: ordering the groups on `account_id` would join account_account for nothing.
+        balance_by_account = dict(self.env['account.move.line']._read_group(
+            domain=[('account_id', 'in', self.ids), ('parent_state', '=', 'posted'), ('company_id', '=', self.env.company.id)],
+            groupby=['account_id'],
+            aggregates=['balance:sum'],
+        ))
         for record in self:
-            record.current_balance = balances.get(record.id, 0)
+            record.current_balance = balance_by_account.get(record._origin, 0)
 
     @api.depends_context('company')
     def _compute_related_taxes_amount(self):
+        taxes_count_by_account = dict(self.env['account.tax.repartition.line']._read_group(
+            domain=[
+                ('account_id', 'in', self.ids),
+                ('tax_id', 'any', self.env['account.tax']._check_company_domain(self.env.company)),
+            ],
+            groupby=['account_id'],
+            aggregates=['tax_id:count_distinct'],
+        ))
         for record in self:
-            record.related_taxes_amount = self.env['account.tax'].search_count([
-                *self.env['account.tax']._check_company_domain(self.env.company),
-                ('repartition_line_ids.account_id', '=', record.id),
-            ])
+            record.related_taxes_amount = taxes_count_by_account.get(record._origin, 0)
 
     @api.depends_context('company')
     def _compute_company_currency_id(self):
-        self.company_currency_id = self.env.company.currency_id
+        # The value is the same for all the records: put it in cache at once rather than going through the setter.
+        field = self._fields['company_currency_id']
+        self.env.cache.update(self, field, itertools.repeat(field.convert_to_cache(self.env.company.currency_id, self)))
 
     @api.depends_context('company')
     def _compute_company_fiscal_country_code(self):
-        self.company_fiscal_country_code = self.env.company.account_fiscal_country_id.code
+        field = self._fields['company_fiscal_country_code']
+        self.env.cache.update(self, field, itertools.repeat(field.convert_to_cache(self.env.company.account_fiscal_country_id.code, self)))
 
     @api.depends_context('company')
     def _compute_opening_debit_credit(self):
-        self.opening_debit = 0
-        self.opening_credit = 0
-        self.opening_balance = 0
         opening_move = self.env.company.account_opening_move_id
         if not self.ids or not opening_move:
+            self.opening_debit = 0
+            self.opening_credit = 0
+            self.opening_balance = 0
             return
-        self.env.cr.execute(SQL(
-            """
-            SELECT line.account_id,
-                   SUM(line.balance) AS balance,
-                   SUM(line.debit) AS debit,
-                   SUM(line.credit) AS credit
-              FROM account_move_line line
-             WHERE line.move_id = %(opening_move_id)s
-               AND line.account_id IN %(account_ids)s
-             GROUP BY line.account_id
-            """,
-            account_ids=tuple(self.ids),
-            opening_move_id=opening_move.id,
-        ))
-        result = {r['account_id']: r for r in self.env.cr.dictfetchall()}
+        result = {
+            account_id: (debit, credit, balance)
+            for account_id, debit, credit, balance in self.env.execute_query(SQL(
+                """
+                SELECT line.account_id,
+                       SUM(line.debit) AS debit,
+                       SUM(line.credit) AS credit,
+                       SUM(line.balance) AS balance
+                  FROM account_move_line line
+                 WHERE line.move_id = %(opening_move_id)s
+                   AND line.account_id IN %(account_ids)s
+                 GROUP BY line.account_id
+                """,
+                account_ids=tuple(self.ids),
+                opening_move_id=opening_move.id,
+            ))
+        }
         for record in self:
-            res = result.get(record.id) or {'debit': 0, 'credit': 0, 'balance': 0}
-            record.opening_debit = res['debit']
-            record.opening_credit = res['credit']
-            record.opening_balance = res['balance']
+            record.opening_debit, record.opening_credit, record.opening_balance = result.get(record.id, (0, 0, 0))
 
     @api.depends('code')
-    def _compute_account_type(self):
-        accounts_to_process = self.filtered(lambda account: account.code and not account.account_type)
-        self._get_closest_parent_account(accounts_to_process, 'account_type', default_value='asset_current')
+    def _compute_account_type_and_tags(self):
+        accounts_without_type = self.filtered(lambda account: account.code and not account.account_type)
+        accounts_without_tags = self.filtered(lambda account: account.code and not account.tag_ids)
+        if not accounts_without_type and not accounts_without_tags:
+            return
 
-    @api.depends('code')
-    def _compute_account_tags(self):
-        accounts_to_process = self.filtered(lambda account: account.code and not account.tag_ids)
-        self._get_closest_parent_account(accounts_to_process, 'tag_ids', default_value=[])
+        codes = list(set((accounts_without_type | accounts_without_tags).mapped('code')))
+        self.flush_model(['account_type', 'tag_ids'])
+        results = self.env.execute_query(self._get_closest_parent_account_sql(
+            codes,
+            SQL('closest_account.account_type'),
+            SQL("""
+                ARRAY(
+                    SELECT rel.account_account_tag_id
+                      FROM account_account_account_tag rel
+                     WHERE rel.account_account_id = closest_account.id
+                )
+            """),
+        ))
+        closest_values_by_code = {code: (account_type, tag_ids) for code, account_type, tag_ids in results}
+
+        for account in accounts_without_type:
+            account.account_type = closest_values_by_code[account.code][0] or 'asset_current'
+        for account in accounts_without_tags:
+            account.tag_ids = self.env['account.account.tag'].browse(closest_values_by_code[account.code][1])
+
+    def _get_closest_parent_account_sql(self, codes, *columns):
+        """ Return the SQL query selecting each code of `codes` along with the given `columns`.
+        In `columns`, `closest_account` refers to the account of the current company having the
+        greatest code strictly lower than the selected one, and only exposes its `id` and `account_type`.
+        Its columns are NULL if there is no such account.
+        """
+        query = self._search(self._check_company_domain(self.env.company))
+        code_sql = self._field_to_sql(query.table, 'code', query)
+        # Compare codes bytewise, as Python does, regardless of the database collation.
+        query.add_where(SQL('%s COLLATE "C" < account_code.code', code_sql))
+        query.order = SQL('%s COLLATE "C" DESC', code_sql)
+        query.limit = 1
+        return SQL(
+            """
+                 SELECT account_code.code, %(columns)s
+                   FROM (VALUES %(account_code_values)s) AS account_code (code)
+              LEFT JOIN LATERAL %(closest_account_query)s AS closest_account ON TRUE
+            """,
+            columns=SQL(', ').join(columns),
+            account_code_values=SQL(','.join(['(%s)'] * len(codes)), *codes),
+            closest_account_query=query.subselect(
+                SQL.identifier(query.table, 'id'),
+                SQL.identifier(query.table, 'account_type'),
+            ),
+        )
 
     def _get_closest_parent_account(self, accounts_to_process, field_name, default_value):
         """
@@ -614,25 +702,18 @@ class AccountAccount(models.Model):
             :param default_value: Default value to be assigned if no parent account is found.
         """
         assert field_name in self._fields
+        if not accounts_to_process:
+            return
 
-        all_accounts = self.search_read(
-            domain=self._check_company_domain(self.env.company),
-            fields=['code', field_name],
-            order='code',
-        )
-        accounts_with_codes = {}
-        # We want to group accounts by company to only search for account codes of the current company
-        for account in all_accounts:
-            accounts_with_codes[account['code']] = account[field_name]
+        codes = list(set(accounts_to_process.mapped('code')))
+        closest_account_id_by_code = dict(self.env.execute_query(
+            self._get_closest_parent_account_sql(codes, SQL('closest_account.id'))
+        ))
+        closest_accounts = self.browse(set(closest_account_id_by_code.values()) - {None})
+        closest_accounts.fetch([field_name])
         for account in accounts_to_process:
-            codes_list = list(accounts_with_codes.keys())
-            closest_index = bisect_left(codes_list, account.code) - 1
-            account[field_name] = accounts_with_codes[codes_list[closest_index]] if closest_index != -1 else default_value
-
-    @api.depends('account_type')
-    def _compute_include_initial_balance(self):
-        for account in self:
-            account.include_initial_balance = account.internal_group not in ['income', 'expense']
+            closest_account = closest_accounts.browse(closest_account_id_by_code[account.code])
+            account[field_name] = closest_account[field_name] if closest_account else default_value
 
     def _search_include_initial_balance(self, operator, value):
         if operator not in ['=', '!='] or not isinstance(value, bool):
@@ -645,20 +726,24 @@ class AccountAccount(models.Model):
         return account_type.split('_', maxsplit=1)[0]
 
     @api.depends('account_type')
-    def _compute_internal_group(self):
-        for account in self:
-            account.internal_group = account.account_type and account._get_internal_group(account.account_type)
+    def _compute_internal_group_and_include_initial_balance(self):
+        # Only derive the group once per distinct account type, and set both fields in the same pass.
+        for account_type, accounts in self.grouped('account_type').items():
+            internal_group = account_type and self._get_internal_group(account_type)
+            accounts.internal_group = internal_group
+            accounts.include_initial_balance = internal_group not in ('income', 'expense')
 
     def _search_internal_group(self, operator, value):
         if operator not in ['=', 'in', '!=', 'not in']:
             raise UserError(_('Operation not supported'))
-        domain = expression.OR([[('account_type', '=like', group)] for group in {
-            self._get_internal_group(v) + '%'
-            for v in (value if isinstance(value, (list, tuple)) else [value])
-        }])
-        if operator in ('!=', 'not in'):
-            return ['!'] + expression.normalize_domain(domain)
-        return domain
+        groups = {self._get_internal_group(v) for v in (value if isinstance(value, (list, tuple)) else [value])}
+        # Resolve the groups to their account types, so that we search with a single IN instead of several LIKE.
+        account_types = [
+            account_type
+            for account_type in self._fields['account_type'].get_values(self.env)
+            if self._get_internal_group(account_type) in groups
+        ]
+        return [('account_type', 'not in' if operator in ('!=', 'not in') else 'in', account_types)]
 
     @api.depends('account_type')
     def _compute_reconcile(self):
@@ -691,14 +776,12 @@ class AccountAccount(models.Model):
         got assigned.
         """
         self.ensure_one()
-        if 'import_account_opening_balance' not in self._cr.precommit.data:
+        data = self._cr.precommit.data.get('import_account_opening_balance')
+        if data is None:
             data = self._cr.precommit.data['import_account_opening_balance'] = {}
             self._cr.precommit.add(self._load_precommit_update_opening_move)
-        else:
-            data = self._cr.precommit.data['import_account_opening_balance']
-        data.setdefault(self.env.company.id, {}).setdefault(self.id, [None, None])
-        index = 0 if field == 'debit' else 1
-        data[self.env.company.id][self.id][index] = amount
+        amounts = data.setdefault(self.env.company.id, {}).setdefault(self.id, [None, None])
+        amounts[0 if field == 'debit' else 1] = amount
 
     @api.model
     def default_get(self, default_fields):
@@ -731,36 +814,29 @@ class AccountAccount(models.Model):
         :param company_id: the company id
         :param partner_id: the partner id for which we want to retrieve the most frequent accounts
         :param move_type: the type of the move to know which type of accounts to retrieve
-        :param filter_never_user_accounts: True if we should filter out accounts never used for the partner
+        :param filter_never_user_accounts: kept for compatibility, accounts never used for the partner are always filtered out
         :param limit: the maximum number of accounts to retrieve
         :returns: List of account ids, ordered by frequency (from most to least frequent)
         """
-        domain = [
-            *self.env['account.move.line']._check_company_domain(company_id),
-            ('partner_id', '=', partner_id),
-            ('account_id.deprecated', '=', False),
-            ('date', '>=', fields.Date.add(fields.Date.today(), days=-365 * 2)),
-        ]
-        if move_type in self.env['account.move'].get_inbound_types(include_receipts=True):
-            domain.append(('account_id.internal_group', '=', 'income'))
-        elif move_type in self.env['account.move'].get_outbound_types(include_receipts=True):
-            domain.append(('account_id.internal_group', '=', 'expense'))
-
-        query = self.env['account.move.line']._where_calc(domain)
-        if not filter_never_user_accounts:
-            _kind, rhs_table, condition = query._joins['account_move_line__account_id']
-            query._joins['account_move_line__account_id'] = (SQL("RIGHT JOIN"), rhs_table, condition)
-
+        # The account conditions are applied through the `_search` subquery on account_id, so only accounts
+        # used for the partner can be returned, whatever the value of filter_never_user_accounts.
+        query = self.env['account.move.line']._where_calc(self._get_most_frequent_accounts_domain(company_id, [partner_id], move_type))
         company = self.env['res.company'].browse(company_id)
-        code_sql = self.with_company(company)._field_to_sql('account_move_line__account_id', 'code', query)
+        code_sql = self.with_company(company)._field_to_sql('account_account', 'code')
 
+        # Journal items are counted before joining the accounts, which are only needed to sort them.
         return [r[0] for r in self.env.execute_query(SQL(
             """
-                SELECT account_move_line__account_id.id
-                  FROM %(from_clause)s
-                 WHERE %(where_clause)s
-              GROUP BY account_move_line__account_id.id
-              ORDER BY COUNT(account_move_line.id) DESC, MAX(%(code_sql)s)
+                SELECT account_account.id
+                  FROM (
+                        SELECT account_move_line.account_id,
+                               COUNT(account_move_line.id) AS frequency
+                          FROM %(from_clause)s
+                         WHERE %(where_clause)s
+                      GROUP BY account_move_line.account_id
+                       ) AS account_frequency
+                  JOIN account_account ON account_account.id = account_frequency.account_id
+              ORDER BY account_frequency.frequency DESC, %(code_sql)s
                 %(limit_clause)s
             """,
             from_clause=query.from_clause,
@@ -769,10 +845,62 @@ class AccountAccount(models.Model):
             limit_clause=SQL("LIMIT %s", limit) if limit else SQL(),
         ))]
 
+    @api.model
+    def _get_most_frequent_accounts_domain(self, company_id, partner_ids, move_type):
+        """ Return the domain on journal items used to determine the most frequent accounts of the given partners. """
+        account_domain = [('deprecated', '=', False)]
+        if move_type in self.env['account.move'].get_inbound_types(include_receipts=True):
+            account_domain.append(('internal_group', '=', 'income'))
+        elif move_type in self.env['account.move'].get_outbound_types(include_receipts=True):
+            account_domain.append(('internal_group', '=', 'expense'))
+        return [
+            *self.env['account.move.line']._check_company_domain(company_id),
+            ('partner_id', 'in', partner_ids),
+            # Use a subquery rather than the `account_id` path, which would join the accounts to every journal item.
+            ('account_id', 'in', self.sudo()._search(account_domain)),
+            ('date', '>=', fields.Date.add(fields.Date.today(), days=-365 * 2)),
+        ]
+
+    @api.model
+    def _get_most_frequent_account_for_partners(self, company_id, partner_ids, move_type=None):
+        """
+        Returns the most frequent account of each of the given partners, in a single query
+        :param company_id: the company id
+        :param partner_ids: the ids of the partners for which we want to retrieve the most frequent account
+        :param move_type: the type of the move to know which type of accounts to retrieve
+        :returns: Dict mapping each partner id to the id of its most frequent account.
+                  Partners without any account used are left out.
+        """
+        if not partner_ids:
+            return {}
+        query = self.env['account.move.line']._where_calc(self._get_most_frequent_accounts_domain(company_id, partner_ids, move_type))
+        company = self.env['res.company'].browse(company_id)
+        code_sql = self.with_company(company)._field_to_sql('account_account', 'code')
+
+        return dict(self.env.execute_query(SQL(
+            """
+                SELECT DISTINCT ON (account_frequency.partner_id)
+                       account_frequency.partner_id,
+                       account_account.id
+                  FROM (
+                        SELECT account_move_line.partner_id,
+                               account_move_line.account_id,
+                               COUNT(account_move_line.id) AS frequency
+                          FROM %(from_clause)s
+                         WHERE %(where_clause)s
+                      GROUP BY account_move_line.partner_id, account_move_line.account_id
+                       ) AS account_frequency
+                  JOIN account_account ON account_account.id = account_frequency.account_id
+              ORDER BY account_frequency.partner_id, account_frequency.frequency DESC, %(code_sql)s
+            """,
+            from_clause=query.from_clause,
+            where_clause=query.where_clause or SQL("TRUE"),
+            code_sql=code_sql,
+        )))
+
     @api.model
     def _get_most_frequent_account_for_partner(self, company_id, partner_id, move_type=None):
-        most_frequent_account = self._get_most_frequent_accounts_for_partner(company_id, partner_id, move_type, filter_never_user_accounts=True, limit=1)
-        return most_frequent_account[0] if most_frequent_account else False
+        return self._get_most_frequent_account_for_partners(company_id, [partner_id], move_type).get(partner_id, False)
 
     @api.model
     def _order_accounts_by_frequency_for_partner(self, company_id, partner_id, move_type=None):
@@ -795,6 +923,9 @@ class AccountAccount(models.Model):
     @api.model
     def _search_display_name(self, operator, value):
         name = value or ''
+        if operator == 'ilike' and not name:
+            # Every account matches, e.g. when opening an autocomplete dropdown: don't filter at all.
+            return []
         if operator in ('=', '!='):
             domain = ['|', ('code', '=', name.split(' ')[0]), ('name', operator, name)]
         else:
@@ -810,7 +941,12 @@ class AccountAccount(models.Model):
 
     def _split_code_name(self, code_name):
         # We only want to split the name on the first word if there is a digit in it
-        code, name = ACCOUNT_REGEX.match(code_name or '').groups()
+        code_name = code_name or ''
+        # Fast path for the usual '<digits> <name>' form, giving the same result as ACCOUNT_REGEX.
+        code, _sep, name = code_name.partition(' ')
+        if code.isdecimal() and '\n' not in name:
+            return code, name.strip()
+        code, name = ACCOUNT_REGEX.match(code_name).groups()
         return code, name.strip()
 
     @api.onchange('name')
@@ -823,13 +959,14 @@ class AccountAccount(models.Model):
     @api.depends_context('company')
     @api.depends('code')
     def _compute_display_name(self):
-        for account in self:
-            account.display_name = f"{account.code} {account.name}" if account.code else account.name
+        for account, code, name in zip(self, self.mapped('code'), self.mapped('name')):
+            account.display_name = f"{code} {name}" if code else name
 
     def copy_data(self, default=None):
         vals_list = super().copy_data(default)
         default = default or {}
         cache = defaultdict(set)
+        new_codes_to_search = []  # list of (vals, company, start_code)
 
         for account, vals in zip(self, vals_list):
             company_ids = self._fields['company_ids'].convert_to_cache(vals['company_ids'], account)
@@ -841,13 +978,25 @@ class AccountAccount(models.Model):
 
                 for company in companies_to_get_new_account_codes:
                     start_code = account.with_company(company).code or account.with_company(account.company_ids[0]).code
-                    new_code = account.with_company(company)._search_new_account_code(start_code, cache[company.id])
-                    vals['code_mapping_ids'].append(Command.create({'company_id': company.id, 'code': new_code}))
-                    cache[company.id].add(new_code)
+                    new_codes_to_search.append((vals, company, start_code))
 
             if 'name' not in default:
                 vals['name'] = self.env._("%s (copy)", account.name or '')
 
+        # Fetch the codes already in use once per company, rather than once per copied account.
+        start_codes_by_company = defaultdict(set)
+        for _vals, company, start_code in new_codes_to_search:
+            start_codes_by_company[company].add(start_code)
+        used_codes_by_company = {
+            company: self.with_company(company)._get_used_account_codes(start_codes)
+            for company, start_codes in start_codes_by_company.items()
+        }
+
+        for vals, company, start_code in new_codes_to_search:
+            new_code = self.with_company(company)._search_new_account_code(start_code, cache[company.id], used_codes_by_company[company])
+            vals['code_mapping_ids'].append(Command.create({'company_id': company.id, 'code': new_code}))
+            cache[company.id].add(new_code)
+
         return vals_list
 
     def copy_translations(self, new, excluded=()):
@@ -892,6 +1041,12 @@ class AccountAccount(models.Model):
                 amount_residual = (debit-credit),
                 amount_residual_currency = amount_currency
             WHERE full_reconcile_id IS NULL and account_id IN %s
+            -- Don't rewrite the lines already having the right values
+            AND (
+                reconciled IS DISTINCT FROM (debit = 0 AND credit = 0 AND amount_currency = 0)
+                OR amount_residual IS DISTINCT FROM (debit-credit)
+                OR amount_residual_currency IS DISTINCT FROM amount_currency
+            )
         """
         self.env.cr.execute(query, [tuple(self.ids)])
         self.env['account.move.line'].invalidate_model(['amount_residual', 'amount_residual_currency', 'reconciled'])
@@ -932,29 +1087,46 @@ class AccountAccount(models.Model):
             return record.id, record.display_name
         raise ValidationError(_("Please create new accounts from the Chart of Accounts menu."))
 
+    @api.model
+    @ormcache()
+    def _get_check_company_fields(self):
+        """ Return the names of the relational fields of accounts having `check_company`. """
+        return tuple(fname for fname, field in self._fields.items() if field.relational and field.check_company)
+
     @api.model_create_multi
     def create(self, vals_list):
-        records_list = []
-
         # As we are creating accounts with a single company at first, check_company fields will need to be added
         # at the end to avoid triggering the check_company constraint.
-        check_company_fields = {fname for fname, field in self._fields.items() if field.relational and field.check_company}
+        check_company_fields = self._get_check_company_fields()
+
+        # Batch the values by companies, even when they are not consecutive, while keeping track of their positions
+        # so that the accounts are returned in the same order as `vals_list`.
+        vals_indexes_by_company_ids = defaultdict(list)
+        for index, vals in enumerate(vals_list):
+            company_ids = self._fields['company_ids'].convert_to_cache(vals.get('company_ids', []), self.browse())
+            vals_indexes_by_company_ids[tuple(company_ids)].append(index)
 
-        for company_ids, vals_list_for_company in itertools.groupby(vals_list, lambda v: v.get('company_ids', [])):
+        account_ids = [None] * len(vals_list)
+        for company_ids, vals_indexes in vals_indexes_by_company_ids.items():
             cache = set()
-            vals_list_for_company = list(vals_list_for_company)
+            vals_list_for_company = [vals_list[index] for index in vals_indexes]
 
             # Determine the companies the new accounts will have. The first one will be used to create the accounts, the others added later.
-            company_ids = self._fields['company_ids'].convert_to_cache(company_ids, self.browse())
             companies = self.env['res.company'].browse(company_ids) or self.env.company
 
-            # Create the accounts with a single company and a single code.
-            code_by_company_list = []
-            for vals in vals_list_for_company:
+            # Determine the starting codes first, to fetch the codes already in use for all of them at once.
+            start_code_by_index = {}
+            for index, vals in enumerate(vals_list_for_company):
                 if 'prefix' in vals:
                     prefix, digits = vals.pop('prefix'), vals.pop('code_digits')
-                    start_code = prefix.ljust(digits - 1, '0') + '1' if len(prefix) < digits else prefix
-                    vals['code'] = self.with_company(companies[0])._search_new_account_code(start_code, cache)
+                    start_code_by_index[index] = prefix.ljust(digits - 1, '0') + '1' if len(prefix) < digits else prefix
+            used_codes = self.with_company(companies[0])._get_used_account_codes(start_code_by_index.values())
+
+            # Create the accounts with a single company and a single code.
+            code_by_company_list = []
+            for index, vals in enumerate(vals_list_for_company):
+                if index in start_code_by_index:
+                    vals['code'] = self.with_company(companies[0])._search_new_account_code(start_code_by_index[index], cache, used_codes)
                     cache.add(vals['code'])
 
                 # Intercept any values in `code_mapping_ids` to write the codes on the newly-created accounts.
@@ -982,23 +1154,26 @@ class AccountAccount(models.Model):
                 if check_company_vals:
                     new_account.write(check_company_vals)
 
-            records_list.append(new_accounts)
+            for index, new_account_id in zip(vals_indexes, new_accounts.ids):
+                account_ids[index] = new_account_id
 
-        records = self.env['account.account'].union(*records_list)
+        records = self.env['account.account'].browse(account_ids)
         records.with_context(allowed_company_ids=records.company_ids.ids)._ensure_code_is_unique()
         return records
 
     def write(self, vals):
         if 'reconcile' in vals:
+            reconcile_accounts = self.filtered('reconcile')
             if vals['reconcile']:
-                self.filtered(lambda r: not r.reconcile)._toggle_reconcile_to_true()
+                (self - reconcile_accounts)._toggle_reconcile_to_true()
             else:
-                self.filtered(lambda r: r.reconcile)._toggle_reconcile_to_false()
+                reconcile_accounts._toggle_reconcile_to_false()
 
-        if vals.get('currency_id'):
-            for account in self:
-                if self.env['account.move.line'].search_count([('account_id', '=', account.id), ('currency_id', 'not in', (False, vals['currency_id']))]):
-                    raise UserError(_('You cannot set a currency on this account as it already has some journal entries having a different foreign currency.'))
+        if vals.get('currency_id') and self.env['account.move.line'].search_count([
+            ('account_id', 'in', self.ids),
+            ('currency_id', 'not in', (False, vals['currency_id'])),
+        ], limit=1):
+            raise UserError(_('You cannot set a currency on this account as it already has some journal entries having a different foreign currency.'))
         res = super().write(vals)
         if {'company_ids', 'code'} & vals.keys():
             self._ensure_code_is_unique()
@@ -1008,19 +1183,20 @@ class AccountAccount(models.Model):
         """ Ensure that for each company to which the account belongs, the code is set
         and that codes are unique per-company. """
         accounts = self.sudo()
-        for account in accounts:
-            for company in account.company_ids:
-                if not account.with_company(company).code:
+        # Read the codes of all the accounts sharing the same companies at once, company per company.
+        for companies, accounts_with_same_companies in accounts.grouped('company_ids').items():
+            for company in companies:
+                if not all(accounts_with_same_companies.with_company(company).mapped('code')):
                     raise ValidationError(_("The code must be set for every company to which this account belongs."))
         accounts_to_check = accounts.filtered(lambda a: a.code and self.env.company in a.company_ids)
-        accounts_by_code = accounts_to_check.grouped('code')
+        code_counts = Counter(accounts_to_check.mapped('code'))
         duplicate_codes = None
-        if len(accounts_by_code) < len(accounts_to_check):
-            duplicate_codes = [code for code, accounts in accounts_by_code.items() if len(accounts) > 1]
+        if len(code_counts) < len(accounts_to_check):
+            duplicate_codes = [code for code, count in code_counts.items() if count > 1]
         # search for duplicates of self in database
         elif duplicates := self.sudo().search_fetch(
             [
-                ('code', 'in', list(accounts_by_code)),
+                ('code', 'in', list(code_counts)),
                 ('id', 'not in', self.ids),
             ],
             ['code'],
@@ -1038,18 +1214,25 @@ class AccountAccount(models.Model):
         super()._load_records_write(values)
 
     @api.ondelete(at_uninstall=False)
-    def _unlink_except_contains_journal_items(self):
-        if self.env['account.move.line'].search_count([('account_id', 'in', self.ids)], limit=1):
+    def _unlink_except_used_elsewhere(self):
+        # Look for journal items, fiscal position mappings and tax repartition lines using the accounts in one query.
+        queries = {
+            'journal_item': self.env['account.move.line']._search([('account_id', 'in', self.ids)], limit=1),
+            'fiscal_position': self.env['account.fiscal.position.account']._search(
+                ['|', ('account_src_id', 'in', self.ids), ('account_dest_id', 'in', self.ids)],
+                limit=1,
+            ),
+            'tax_repartition_line': self.env['account.tax.repartition.line']._search([('account_id', 'in', self.ids)], limit=1),
+        }
+        used_in = {usage for usage, in self.env.execute_query(SQL(" UNION ALL ").join(
+            SQL("(%s)", query.select(SQL("%s", usage)))
+            for usage, query in queries.items()
+        ))}
+        if 'journal_item' in used_in:
             raise UserError(_('You cannot perform this action on an account that contains journal items.'))
-
-    @api.ondelete(at_uninstall=False)
-    def _unlink_except_linked_to_fiscal_position(self):
-        if self.env['account.fiscal.position.account'].search_count(['|', ('account_src_id', 'in', self.ids), ('account_dest_id', 'in', self.ids)], limit=1):
+        if 'fiscal_position' in used_in:
             raise UserError(_('You cannot remove/deactivate the accounts "%s" which are set on the account mapping of a fiscal position.', ', '.join(f"{a.code} - {a.name}" for a in self)))
-
-    @api.ondelete(at_uninstall=False)
-    def _unlink_except_linked_to_tax_repartition_line(self):
-        if self.env['account.tax.repartition.line'].search_count([('account_id', 'in', self.ids)], limit=1):
+        if 'tax_repartition_line' in used_in:
             raise UserError(_('You cannot remove/deactivate the accounts "%s" which are set on a tax repartition line.', ', '.join(f"{a.code} - {a.name}" for a in self)))
 
     def action_open_related_taxes(self):
@@ -1161,14 +1344,15 @@ class AccountAccount(models.Model):
         # Step 2: Create new accounts.
         base_company = self.env.company if self.env.company in self.company_ids else self.company_ids[0]
         companies_to_update = self.company_ids - base_company
-        check_company_fields = {fname for fname, field in self._fields.items() if field.relational and field.check_company}
+        # Split the check_company values by company once, instead of filtering them again for every new account.
+        corecords_by_company_by_fname = {fname: self[fname].grouped('company_id') for fname in self._get_check_company_fields()}
         new_account_by_company = {
             company: self.copy(default={
                 'name': self.name,
                 'company_ids': [Command.set(company.ids)],
                 **{
-                    fname: self[fname].filtered(lambda record: record.company_id == company)
-                    for fname in check_company_fields
+                    fname: corecords_by_company.get(company, self[fname].browse())
+                    for fname, corecords_by_company in corecords_by_company_by_fname.items()
                 }
             })
             for company in companies_to_update
@@ -1378,8 +1562,8 @@ class AccountAccount(models.Model):
 
         # Step 4: Change check_company fields to only keep values compatible with the account's company, and update company_ids on account.
         write_vals = {'company_ids': [Command.set(base_company.ids)]}
-        check_company_fields = {field for field in self._fields.values() if field.relational and field.check_company}
-        for field in check_company_fields:
+        for fname in self._get_check_company_fields():
+            field = self._fields[fname]
             corecord = self[field.name]
             filtered_corecord = corecord.filtered_domain(corecord._check_company_domain(base_company))
             write_vals[field.name] = filtered_corecord.id if field.type == 'many2one' else [Command.set(filtered_corecord.ids)]
@@ -1418,6 +1602,14 @@ class AccountGroup(models.Model):
         ),
     ]
 
+    def init(self):
+        super().init()
+        # Used to look for overlapping groups with the same granularity.
+        create_index(self.env.cr,
+                     indexname='account_group_company_prefix_length_idx',
+                     tablename='account_group',
+                     expressions=['company_id', '(char_length(code_prefix_start))', 'code_prefix_start', 'code_prefix_end'])
+
     @api.depends('code_prefix_start')
     def _compute_code_prefix_end(self):
         for group in self:
@@ -1432,11 +1624,9 @@ class AccountGroup(models.Model):
 
     @api.depends('code_prefix_start', 'code_prefix_end')
     def _compute_display_name(self):
-        for group in self:
-            prefix = group.code_prefix_start and str(group.code_prefix_start)
-            if prefix and group.code_prefix_end != group.code_prefix_start:
-                prefix += '-' + str(group.code_prefix_end)
-            group.display_name = ' '.join(filter(None, [prefix, group.name]))
+        for group, start, end, name in zip(self, self.mapped('code_prefix_start'), self.mapped('code_prefix_end'), self.mapped('name')):
+            prefix = f"{start}-{end}" if start and end != start else start
+            group.display_name = f"{prefix} {name}" if prefix and name else prefix or name or ''
 
     @api.model
     def _search_display_name(self, operator, value):
@@ -1449,30 +1639,29 @@ class AccountGroup(models.Model):
 
     @api.constrains('code_prefix_start', 'code_prefix_end')
     def _constraint_prefix_overlap(self):
-        self.flush_model()
-        query = """
+        self.flush_model(['code_prefix_start', 'code_prefix_end', 'company_id'])
+        # Two ranges overlap when each one starts before the other one ends.
+        query = SQL("""
             SELECT other.id FROM account_group this
             JOIN account_group other
-              ON char_length(other.code_prefix_start) = char_length(this.code_prefix_start)
+              ON other.company_id = this.company_id
+             AND char_length(other.code_prefix_start) = char_length(this.code_prefix_start)
+             AND other.code_prefix_start <= this.code_prefix_end
+             AND other.code_prefix_end >= this.code_prefix_start
              AND other.id != this.id
-             AND other.company_id = this.company_id
-             AND (
-                other.code_prefix_start <= this.code_prefix_start AND this.code_prefix_start <= other.code_prefix_end
-                OR
-                other.code_prefix_start >= this.code_prefix_start AND this.code_prefix_end >= other.code_prefix_start
-            )
             WHERE this.id IN %(ids)s
-        """
-        self.env.cr.execute(query, {'ids': tuple(self.ids)})
-        res = self.env.cr.fetchall()
-        if res:
+            LIMIT 1
+        """, ids=tuple(self.ids))
+        if self.env.execute_query(query):
             raise ValidationError(_('Account Groups with the same granularity can\'t overlap'))
 
     def _sanitize_vals(self, vals):
-        if vals.get('code_prefix_start') and 'code_prefix_end' in vals and not vals['code_prefix_end']:
-            del vals['code_prefix_end']
-        if vals.get('code_prefix_end') and 'code_prefix_start' in vals and not vals['code_prefix_start']:
-            del vals['code_prefix_start']
+        # Don't let an empty prefix erase the other one: it will be computed from it instead.
+        code_prefix_start, code_prefix_end = vals.get('code_prefix_start'), vals.get('code_prefix_end')
+        if code_prefix_start and not code_prefix_end:
+            vals.pop('code_prefix_end', None)
+        elif code_prefix_end and not code_prefix_start:
+            vals.pop('code_prefix_start', None)
         return vals
 
     @api.constrains('parent_id')
@@ -1487,15 +1676,28 @@ class AccountGroup(models.Model):
         return groups
 
     def write(self, vals):
-        res = super(AccountGroup, self).write(self._sanitize_vals(vals))
+        prefixes_before = None
         if 'code_prefix_start' in vals or 'code_prefix_end' in vals:
-            self._adapt_parent_account_group()
+            prefixes_before = {group: (group.code_prefix_start, group.code_prefix_end) for group in self}
+        res = super(AccountGroup, self).write(self._sanitize_vals(vals))
+        if prefixes_before is not None:
+            # Only the groups whose prefixes actually changed can have moved in the hierarchy.
+            self.filtered(
+                lambda group: (group.code_prefix_start, group.code_prefix_end) != prefixes_before[group]
+            )._adapt_parent_account_group()
         return res
 
     def unlink(self):
-        for record in self:
-            children_ids = self.env['account.group'].search([('parent_id', '=', record.id)])
-            children_ids.write({'parent_id': record.parent_id.id})
+        # Attach the remaining children to their closest ancestor not being deleted, with one write per ancestor.
+        children = self.env['account.group'].search([('parent_id', 'in', self.ids), ('id', 'not in', self.ids)])
+        children_by_new_parent = defaultdict(lambda: self.env['account.group'])
+        for parent, parent_children in children.grouped('parent_id').items():
+            new_parent = parent.parent_id
+            while new_parent in self:
+                new_parent = new_parent.parent_id
+            children_by_new_parent[new_parent] |= parent_children
+        for new_parent, new_children in children_by_new_parent.items():
+            new_children.write({'parent_id': new_parent.id})
         return super().unlink()
 
     def _adapt_parent_account_group(self, company=None):
@@ -1512,21 +1714,24 @@ class AccountGroup(models.Model):
         if not company_ids:
             return
 
-        self.flush_model()
+        self.flush_model(['code_prefix_start', 'code_prefix_end', 'company_id', 'parent_id'])
         query = SQL("""
             WITH relation AS (
-                SELECT DISTINCT ON (child.id)
-                       child.id AS child_id,
+                SELECT child.id AS child_id,
                        parent.id AS parent_id
-                  FROM account_group parent
-                  JOIN account_group child
-                    ON char_length(parent.code_prefix_start) < char_length(child.code_prefix_start)
-                   AND parent.code_prefix_start <= LEFT(child.code_prefix_start, char_length(parent.code_prefix_start))
-                   AND parent.code_prefix_end >= LEFT(child.code_prefix_end, char_length(parent.code_prefix_end))
-                   AND parent.id != child.id
-                   AND parent.company_id = child.company_id
+                  FROM account_group child
+                  JOIN LATERAL (
+                        SELECT parent.id
+                          FROM account_group parent
+                         WHERE parent.company_id = child.company_id
+                           AND char_length(parent.code_prefix_start) < char_length(child.code_prefix_start)
+                           AND parent.code_prefix_start <= LEFT(child.code_prefix_start, char_length(parent.code_prefix_start))
+                           AND parent.code_prefix_end >= LEFT(child.code_prefix_end, char_length(parent.code_prefix_start))
+                           AND parent.id != child.id
+                      ORDER BY char_length(parent.code_prefix_start) DESC
+                         LIMIT 1
+                       ) parent ON TRUE
                  WHERE child.company_id IN %s
-              ORDER BY child.id, char_length(parent.code_prefix_start) DESC
             )
             UPDATE account_group child
                SET parent_id = relation.parent_id
@@ -1539,4 +1744,4 @@ class AccountGroup(models.Model):
 
         updated_rows = self.env.cr.fetchall()
         if updated_rows:
-            self.invalidate_model(['parent_id'])
+            self.browse(row[0] for row in updated_rows).invalidate_recordset(['parent_id'])
@@ -591,22 +591,23 @@ class AccountMoveLine(models.Model):
                 line.account_id = account_id
 
         product_lines = self.filtered(lambda line: line.display_type == 'product' and line.move_id.is_invoice(True))
-        for line in product_lines:
-            if line.product_id:
-                fiscal_position = line.move_id.fiscal_position_id
-                accounts = line.with_company(line.company_id).product_id\
-                    .product_tmpl_id.get_product_accounts(fiscal_pos=fiscal_position)
-                if line.move_id.is_sale_document(include_receipts=True):
-                    line.account_id = accounts['income'] or line.account_id
-                elif line.move_id.is_purchase_document(include_receipts=True):
-                    line.account_id = accounts['expense'] or line.account_id
-            elif line.partner_id:
-                account_id = self.env['account.account']._get_most_frequent_account_for_partner(
-                    company_id=line.company_id.id,
-                    partner_id=line.partner_id.id,
-                    move_type=line.move_id.move_type,
-                )
-                if account_id:
+        for line in product_lines.filtered('product_id'):
+            fiscal_position = line.move_id.fiscal_position_id
+            accounts = line.with_company(line.company_id).product_id\
+                .product_tmpl_id.get_product_accounts(fiscal_pos=fiscal_position)
+            if line.move_id.is_sale_document(include_receipts=True):
+                line.account_id = accounts['income'] or line.account_id
+            elif line.move_id.is_purchase_document(include_receipts=True):
+                line.account_id = accounts['expense'] or line.account_id
+        partner_lines = product_lines.filtered(lambda line: not line.product_id and line.partner_id)
+        for (company, move_type), lines in partner_lines.grouped(lambda line: (line.company_id, line.move_id.move_type)).items():
+            account_id_by_partner_id = self.env['account.account']._get_most_frequent_account_for_partners(
+                company_id=company.id,
+                partner_ids=lines.partner_id.ids,
+                move_type=move_type,
+            )
+            for line in lines:
+                if account_id := account_id_by_partner_id.get(line.partner_id.id):
                     line.account_id = account_id
         for line in self:
             if not line.account_id and line.display_type not in ('line_section', 'line_note'):
@@ -2,7 +2,7 @@
 from itertools import accumulate
 
 from odoo import api, fields, models
-from odoo.tools import Query
+from odoo.tools import OrderedSet, Query
 
 
 class AccountRoot(models.Model):
@@ -31,6 +31,11 @@ class AccountRoot(models.Model):
     def _from_account_code(self, code):
         return self.browse(code and code[:2])
 
+    @api.model
+    def _from_account_codes(self, codes):
+        """ Return the distinct roots of the given account codes. """
+        return self.browse(OrderedSet(code[:2] for code in codes if code))
+
     def _compute_root(self):
         for root in self:
             root.name = root.id
@@ -3,6 +3,7 @@ from odoo.addons.account.tests.common import TestAccountMergeCommon
 from odoo.tests import Form, tagged
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools import mute_logger
+from unittest.mock import patch
 import psycopg2
 from freezegun import freeze_time
 
@@ -116,6 +117,45 @@ class TestAccountAccount(TestAccountMergeCommon):
         with self.assertRaises(UserError):
             self.company_data['default_account_revenue'].company_ids = company_2
 
+    def test_account_company_with_branch_journal_items(self):
+        ''' Test that journal items of a branch are allowed on an account of its parent company only. '''
+        company = self.company_data['company']
+        branch = self.env['res.company'].create({
+            'name': 'Branch',
+            'country_id': company.country_id.id,
+            'parent_id': company.id,
+        })
+        self.cr.precommit.run()  # load the CoA
+
+        account = self.env['account.account'].create({
+            'code': '180100',
+            'name': 'My Account in the Parent Company',
+            'account_type': 'asset_current',
+            'company_ids': [Command.link(company.id)],
+        })
+        move = self.env['account.move'].create({
+            'move_type': 'entry',
+            'date': '2019-01-01',
+            'company_id': branch.id,
+            'journal_id': self.company_data['default_journal_misc'].id,
+            'line_ids': [
+                Command.create({'name': 'line_debit', 'account_id': account.id}),
+                Command.create({'name': 'line_credit', 'account_id': account.id}),
+            ],
+        })
+        self.assertEqual(move.line_ids.company_id, branch)
+
+        # The journal items of the branch are still allowed since the account keeps the parent company.
+        company_2 = self.company_data_2['company']
+        account.with_company(company_2).write({
+            'code': '180100',
+            'company_ids': [Command.link(company_2.id)],
+        })
+        self.assertEqual(account.company_ids, company + company_2)
+
+        with self.assertRaises(UserError):
+            account.company_ids = company_2
+
     def test_toggle_reconcile(self):
         ''' Test the feature when the user sets an account as reconcile/not reconcile with existing journal entries. '''
         account = self.company_data['default_account_revenue']
@@ -269,6 +309,16 @@ class TestAccountAccount(TestAccountMergeCommon):
         new_account.code = alternate_code
         self.assertEqual(new_account.account_type, existing_account.account_type)
 
+    def test_account_type_journal_default_account(self):
+        """ Default accounts of sale, purchase and bank journals can't become receivable or payable. """
+        for journal, message in (
+            (self.company_data['default_journal_sale'], "'sale' or 'purchase' journal"),
+            (self.company_data['default_journal_purchase'], "'sale' or 'purchase' journal"),
+            (self.company_data['default_journal_bank'], "Bank Account on a journal"),
+        ):
+            with self.subTest(journal=journal.type), self.assertRaisesRegex(ValidationError, message), self.cr.savepoint():
+                journal.default_account_id.write({'account_type': 'liability_payable', 'reconcile': True})
+
     def test_get_closest_parent_account(self):
         self.env['account.account'].create({
             'code': 99998,
@@ -313,6 +363,21 @@ class TestAccountAccount(TestAccountMergeCommon):
 
             self.assertListEqual(tested_codes, expected_tested_codes)
 
+    def test_search_new_account_code_batch(self):
+        """ Test that accounts copied or created together get distinct codes, skipping the codes already in use. """
+        accounts = self.env['account.account'].create([
+            {'code': code, 'name': 'Test', 'account_type': 'asset_current'}
+            for code in ('102100', '102101', '102103')
+        ])
+        copies = accounts[:2].copy()
+        self.assertEqual(copies.mapped('code'), ['102102', '102104'])
+
+        new_accounts = self.env['account.account'].create([
+            {'prefix': '1021', 'code_digits': 6, 'name': 'Test', 'account_type': 'asset_current'}
+            for _ in range(2)
+        ])
+        self.assertEqual(new_accounts.mapped('code'), ['102105', '102106'])
+
     def test_compute_current_balance(self):
         """ Test if an account's current_balance is computed correctly """
 
@@ -355,6 +420,72 @@ class TestAccountAccount(TestAccountMergeCommon):
         account_payable._compute_current_balance()
         self.assertEqual(account_payable.current_balance, -100, 'Draft invoices/bills should not be used when computing the balance')
 
+    def test_compute_and_search_used(self):
+        account_used = self.company_data['default_account_revenue'].copy()
+        account_unused = self.company_data['default_account_revenue'].copy()
+        accounts = account_used + account_unused
+        self.assertEqual(accounts.mapped('used'), [False, False])
+
+        self.env['account.move'].create({
+            'line_ids': [
+                Command.create({'account_id': account_used.id, 'debit': 100.0}),
+                Command.create({'account_id': self.company_data['default_account_receivable'].id, 'credit': 100.0}),
+            ],
+        })
+        accounts.invalidate_recordset(['used'])
+        self.assertEqual(accounts.mapped('used'), [True, False])
+
+        self.assertEqual(accounts.filtered_domain([('used', '=', True)]), account_used)
+        self.assertEqual(self.env['account.account'].search([('id', 'in', accounts.ids), ('used', '=', True)]), account_used)
+        self.assertEqual(self.env['account.account'].search([('id', 'in', accounts.ids), ('used', '!=', True)]), account_unused)
+
+    def test_compute_related_taxes_amount(self):
+        """ Each tax is counted once per account, whatever the number of its repartition lines on it. """
+        account = self.company_data['default_account_revenue'].copy()
+        self.assertEqual(account.related_taxes_amount, 0)
+
+        taxes = self.tax_sale_a.copy() + self.tax_sale_b.copy()
+        taxes.repartition_line_ids.filtered(lambda line: line.repartition_type == 'tax').account_id = account
+        account.invalidate_recordset(['related_taxes_amount'])
+        self.assertEqual(account.related_taxes_amount, 2)
+
+        taxes[0].active = False
+        account.invalidate_recordset(['related_taxes_amount'])
+        self.assertEqual(account.related_taxes_amount, 1)
+
+    def test_unlink_account_used_elsewhere(self):
+        """ Accounts used on journal items, fiscal position mappings or tax repartition lines can't be deleted. """
+        account_journal_item, account_fiscal_position, account_tax, account_unused = (
+            self.company_data['default_account_revenue'].copy() for _ in range(4)
+        )
+
+        self.env['account.move'].create({
+            'line_ids': [
+                Command.create({'account_id': account_journal_item.id, 'debit': 100.0}),
+                Command.create({'account_id': self.company_data['default_account_receivable'].id, 'credit': 100.0}),
+            ],
+        })
+        self.env['account.fiscal.position'].create({
+            'name': 'Fiscal Position',
+            'account_ids': [Command.create({
+                'account_src_id': self.company_data['default_account_expense'].id,
+                'account_dest_id': account_fiscal_position.id,
+            })],
+        })
+        tax = self.tax_sale_a.copy()
+        tax.repartition_line_ids.filtered(lambda line: line.repartition_type == 'tax').account_id = account_tax
+
+        for account, message in (
+            (account_journal_item, "journal items"),
+            (account_fiscal_position, "fiscal position"),
+            (account_tax, "tax repartition line"),
+        ):
+            with self.subTest(message=message), self.assertRaisesRegex(UserError, message):
+                account.unlink()
+
+        account_unused.unlink()
+        self.assertFalse(account_unused.exists())
+
     def test_name_create_account_code_only(self):
         """
         Test account creation with only a code, with and without space
@@ -411,6 +542,32 @@ class TestAccountAccount(TestAccountMergeCommon):
         self.assertEqual(account.code, "31415")
         self.assertEqual(account.name, "CO2-contributions")
 
+    def test_create_accounts_interleaved_companies(self):
+        """ Accounts of different companies are returned in the order of the values, even when batched per company. """
+        company_1 = self.company_data['company']
+        company_2 = self.company_data_2['company']
+        accounts = self.env['account.account'].with_context(allowed_company_ids=(company_1 | company_2).ids).create([
+            {'code': '314161', 'name': 'Account 1', 'account_type': 'expense', 'company_ids': [Command.set(company_1.ids)]},
+            {'code': '314162', 'name': 'Account 2', 'account_type': 'expense', 'company_ids': [Command.set(company_2.ids)]},
+            {'code': '314163', 'name': 'Account 3', 'account_type': 'expense', 'company_ids': [Command.set(company_1.ids)]},
+        ])
+        self.assertRecordValues(accounts, [
+            {'name': 'Account 1', 'company_ids': company_1.ids},
+            {'name': 'Account 2', 'company_ids': company_2.ids},
+            {'name': 'Account 3', 'company_ids': company_1.ids},
+        ])
+
+    def test_account_code_allowed_characters(self):
+        """ Account codes can only contain alphanumeric characters and dots. """
+        account = self.env['account.account'].create({
+            'code': 'AB.12',
+            'name': 'A new account',
+            'account_type': 'expense',
+        })
+        for invalid_code in ('AB 12', 'AB-12', 'AB12\n', '12é'):
+            with self.subTest(code=invalid_code), self.assertRaises(ValidationError):
+                account.code = invalid_code
+
     def test_account_name_onchange(self):
         """
         Test various scenarios when creating an account via a form
@@ -499,6 +656,29 @@ class TestAccountAccount(TestAccountMergeCommon):
         )
         self.assertFalse(account.id in results_2, "Deprecated account should NOT appear in account suggestions")
 
+    @freeze_time('2023-09-30')
+    def test_most_frequent_account_for_partners(self):
+        """ The most frequent account of several partners is retrieved at once. """
+        partner_1, partner_2, partner_3 = self.env['res.partner'].create([{'name': f'partner_{i}'} for i in range(3)])
+        account_revenue = self.company_data['default_account_revenue']
+        account_other = account_revenue.copy()
+        for partner, accounts in ((partner_1, account_revenue + account_other + account_other), (partner_2, account_revenue)):
+            self.env['account.move'].create({
+                'move_type': 'out_invoice',
+                'partner_id': partner.id,
+                'invoice_date': '2023-09-30',
+                'line_ids': [Command.create({'price_unit': 100, 'account_id': account.id}) for account in accounts],
+            })
+
+        self.assertEqual(
+            self.env['account.account']._get_most_frequent_account_for_partners(
+                company_id=self.env.company.id,
+                partner_ids=(partner_1 + partner_2 + partner_3).ids,
+                move_type='out_invoice',
+            ),
+            {partner_1.id: account_other.id, partner_2.id: account_revenue.id},
+        )
+
     @freeze_time('2017-01-01')
     def test_account_opening_balance(self):
         company = self.env.company
@@ -777,3 +957,43 @@ class TestAccountAccount(TestAccountMergeCommon):
         self.assertEqual(group_10.parent_id, group_1)
         self.assertEqual(group_100.parent_id, group_10)
         self.assertEqual(group_101.parent_id, group_10)
+
+    def test_account_group_unlink_reparent_children(self):
+        """ Test that deleting several account groups at once attaches their children to the closest remaining ancestor """
+        groups = self.env['account.group'].create([
+            {'name': f'group_{prefix}', 'code_prefix_start': prefix, 'code_prefix_end': prefix, 'company_id': self.env.company.id}
+            for prefix in ('1', '10', '100', '101', '2', '20', '200')
+        ])
+        group_1, group_10, group_100, group_101, group_2, group_20, group_200 = groups
+
+        (group_1 + group_10 + group_20).unlink()
+
+        self.assertRecordValues(group_100 + group_101 + group_2 + group_200, [
+            {'parent_id': False},
+            {'parent_id': False},
+            {'parent_id': False},
+            {'parent_id': group_2.id},
+        ])
+
+    def test_account_group_write_adapt_changed_prefixes(self):
+        """ Test that writing the prefixes of account groups only adapts the hierarchy for the groups whose prefixes changed """
+        groups = self.env['account.group'].create([
+            {'name': f'group_{prefix}', 'code_prefix_start': prefix, 'code_prefix_end': prefix, 'company_id': self.env.company.id}
+            for prefix in ('1', '10', '2', '20', '101')
+        ])
+        group_1, group_10, group_2, group_20, group_101 = groups
+        self.assertEqual(group_101.parent_id, group_10)
+
+        AccountGroup = self.env.registry['account.group']
+        with patch.object(AccountGroup, '_adapt_parent_account_group', autospec=True, side_effect=AccountGroup._adapt_parent_account_group) as adapt_parent:
+            group_10.write({'code_prefix_start': '10', 'code_prefix_end': '10'})
+            self.assertFalse(adapt_parent.call_args.args[0])
+
+            group_101.write({'code_prefix_start': '201', 'code_prefix_end': '201'})
+            self.assertEqual(adapt_parent.call_args.args[0], group_101)
+
+        self.assertRecordValues(group_10 + group_20 + group_101, [
+            {'parent_id': group_1.id},
+            {'parent_id': group_2.id},
+            {'parent_id': group_20.id},
+        ])
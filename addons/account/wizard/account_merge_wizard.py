@@ -157,6 +157,12 @@ class AccountMergeWizard(models.TransientModel):
         # of these accounts.
         self._check_access_rights(accounts)
 
+        # Only the xmlids of the removed accounts could be cached with a stale value once they are deleted.
+        has_xmlids_to_move = bool(self.env['ir.model.data'].sudo().search_count([
+            ('model', '=', 'account.account'),
+            ('res_id', 'in', accounts_to_remove.ids),
+        ], limit=1))
+
         # Step 3: Update records in DB.
         # 3.1: Update foreign keys in DB
         wiz = self.env['base.partner.merge.automatic.wizard'].new()
@@ -202,7 +208,8 @@ class AccountMergeWizard(models.TransientModel):
         ))
 
         # Clear ir.model.data ormcache
-        self.env.registry.clear_cache()
+        if has_xmlids_to_move:
+            self.env.registry.clear_cache()
 
         # Step 5: Write company_ids and codes on the account
         for company, code in code_by_company.items():